@@ -1,20 +1,29 @@
 import requests
-from bs4 import BeautifulSoup
-import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.util.request import ACCEPT_ENCODING
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.dammit import EncodingDetector
+import asyncio
 import os
 from openpyxl import Workbook, load_workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
 from datetime import datetime
-import difflib
+from diff_match_patch import diff_match_patch
 import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email.mime.text import MIMEText
-from email import encoders
+from email.message import EmailMessage, MIMEPart
 from dotenv import load_dotenv
 import re
-import pytz
+from zoneinfo import ZoneInfo
 import ssl
 import logging
+import atexit
+import hashlib
+import csv
+import codecs
+import base64
+import io
+import json
 
 # ロギングの設定
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -22,43 +31,261 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # .env ファイルから環境変数を読み込む
 load_dotenv()
 
+# 同じホストに繰り返しアクセスするため、セッションを使い回して接続(TLS)を維持する
+_SESSION = requests.Session()
+_SESSION.headers.update({
+    "User-Agent": "website_checker_to_excel",
+    # 圧縮して転送してもらう(brotli がインストールされていれば br も要求する)
+    "Accept-Encoding": ACCEPT_ENCODING,
+})
+_ADAPTER = HTTPAdapter(
+    pool_connections=100,  # 監視するホストごとに接続プールを保持する
+    pool_maxsize=4,
+    max_retries=Retry(total=3, backoff_factor=1, status_forcelist=[502, 503, 504]),
+)
+_SESSION.mount("https://", _ADAPTER)
+_SESSION.mount("http://", _ADAPTER)
+atexit.register(_SESSION.close)
+
+# URLごとの前回のレスポンスの検証子(条件付きGETに使用する)
+_last_etag = {}
+_last_modified = {}
+
+# 監視の間隔(秒)。変更がなければ最長間隔まで倍にしていき、変更を検出したら最短間隔に戻す
+MIN_POLL_INTERVAL = 300
+MAX_POLL_INTERVAL = 3600
+# サイトにアクセスできなかった場合の再試行までの間隔(秒)
+RETRY_INTERVAL = 300
+
+# SMTPサーバーとの通信のタイムアウト(秒)。切れた接続で監視全体が止まらないようにする
+SMTP_TIMEOUT = 30
+
+# 再起動後も前回の内容と比較して監視を再開するための状態ファイル
+STATE_FILENAME = '.website_checker_state.json'
+
+# 記録に使う日本時間のタイムゾーンと時刻の書式
+_JAPAN_TZ = ZoneInfo('Asia/Tokyo')
+_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 入力されたURLの形式を確認する正規表現
+_URL_RE = re.compile(r'^https?://[\w\-.]+\.[a-zA-Z]{2,}')
+
+# Content-Type ヘッダーから charset を取り出す正規表現
+_CHARSET_RE = re.compile(r'charset=["\']?([\w\-:.]+)', re.IGNORECASE)
+
+# 差分の単位にするため、HTMLのタグの境界を見つける正規表現
+_TAG_BOUNDARY_RE = re.compile(r'>\s*<')
+
+# 解析時に <style> タグだけを残すためのフィルター
+_STYLE_STRAINER = SoupStrainer('style')
+
+# サーバーが 304 Not Modified を返したことを示す値
+UNCHANGED = object()
+
+# 差分計算用のインスタンス(呼び出しごとに生成しないよう1つを使い回す)
+_DMP = diff_match_patch()
+_DMP.Diff_Timeout = 1.0  # 大きなページでも差分計算を1秒で打ち切る
+
+# 差分は長くなることがあるため、CSVの1項目あたりの上限を引き上げる
+csv.field_size_limit(2**31 - 1)
+
 def get_website_content(url):
-    """指定されたURLからウェブサイトの内容を取得する"""
+    """
+    指定されたURLからウェブサイトの内容を取得する
+
+    (内容のバイト列, ヘッダーで指定された文字コード, 内容のハッシュ値) を返す。
+    変更がない場合は UNCHANGED を返す。
+    """
+    headers = {}
+    if _last_etag.get(url):
+        headers["If-None-Match"] = _last_etag[url]
+    if _last_modified.get(url):
+        headers["If-Modified-Since"] = _last_modified[url]
     try:
-        response = requests.get(url, timeout=10)
+        response = _SESSION.get(url, headers=headers, timeout=10)
         response.raise_for_status()  # HTTPエラーがある場合に例外を発生させる
-        response.encoding = response.apparent_encoding  # 文字化け防止
-        return response.text
+        if response.status_code == 304:
+            return UNCHANGED
+        _last_etag[url] = response.headers.get("ETag")
+        _last_modified[url] = response.headers.get("Last-Modified")
+        # デコードは内容が変わったときだけ parse_html で行う
+        content = response.content
+        match = _CHARSET_RE.search(response.headers.get("Content-Type", ""))
+        charset = match.group(1) if match else None
+        return content, charset, hashlib.blake2b(content, digest_size=16).digest()
     except requests.RequestException as e:
         logging.warning(f"ウェブサイトにアクセスできません: {url} - エラー: {e}")
         return None
 
-def parse_html(content):
-    """HTMLコンテンツを解析し、HTML構造とCSSを抽出する"""
-    soup = BeautifulSoup(content, 'html.parser')
-    html = soup.prettify()
-    css = '\n'.join([style.string for style in soup.find_all('style')])
+# Pythonの codecs が知らないが、日本語のサイトでよく使われる文字コード名
+_ENCODING_ALIASES = {
+    'windows-31j': 'cp932',
+    'x-sjis': 'shift_jis',
+}
+
+def _lookup_encoding(name):
+    """文字コード名を正規化する(Pythonで扱えない場合は None を返す)"""
+    if not name:
+        return None
+    try:
+        return codecs.lookup(_ENCODING_ALIASES.get(name.lower(), name)).name
+    except LookupError:
+        return None
+
+def detect_encoding(content, charset=None):
+    """
+    HTMLコンテンツ(バイト列)の文字コードを判定する
+
+    HTTPヘッダーの charset、<meta> タグでの宣言の順に確認し、どちらもなければ UTF-8 とする。
+    本文全体の統計的な推定(apparent_encoding)は行わない(lxml がこの文字コードで解析できない場合は
+    BeautifulSoup が推定にフォールバックすることがある)。
+    """
+    return (_lookup_encoding(charset)
+            or _lookup_encoding(EncodingDetector.find_declared_encoding(content, is_html=True))
+            or 'utf-8')
+
+def parse_html(content, charset=None):
+    """HTMLコンテンツ(バイト列)を解析し、HTML構造とCSSを抽出する"""
+    encoding = detect_encoding(content, charset)
+    # CSSの抽出にしか使わないため、<style> タグ以外は木を構築しない(C実装の lxml で高速に解析する)
+    soup = BeautifulSoup(content, 'lxml', from_encoding=encoding, parse_only=_STYLE_STRAINER)
+    # prettify() で木全体を整形し直す代わりに、元のHTMLをタグの境界で改行して差分の単位にする
+    text = content.decode(encoding, errors='replace')
+    html = _TAG_BOUNDARY_RE.sub('>\n<', text)
+    # <style> の中身が複数のノードに分かれていても(.string が None になる場合も)取りこぼさないよう get_text() を使う
+    css = '\n'.join(style.get_text() for style in soup.select('style'))
     return html, css
 
-def get_diff(old_content, new_content):
-    """2つのコンテンツの差分を取得する"""
-    diff = difflib.unified_diff(old_content.splitlines(), new_content.splitlines(), lineterm='')
-    return '\n'.join(list(diff)[2:])  # 最初の2行(差分ヘッダー)を除外
-
-def write_to_excel(filename, timestamp, url, html_diff, css_diff):
-    """変更内容をExcelファイルに書き込む"""
-    if not os.path.exists(filename):
-        wb = Workbook()
-        ws = wb.active
-        ws.append(["Timestamp", "URL", "HTML Changes", "CSS Changes"])
-    else:
-        wb = load_workbook(filename)
-        ws = wb.active
-
-    ws.append([timestamp, url, html_diff, css_diff])
-    wb.save(filename)
-
-def send_email(subject, body, to_email, attachment_path=None):
+def get_diff(old_lines, new_content):
+    """
+    前回の行のリストと新しいコンテンツの差分を行単位で取得する
+
+    (差分, 新しいコンテンツの行のリスト) を返す。差分は追加行の先頭に "+"、削除行の先頭に "-" を付ける。
+    返した行のリストは、次回の呼び出しで old_lines として使い回す。
+    """
+    new_lines = new_content.splitlines()
+
+    # 各行を1文字に置き換えて差分を取り、行単位の差分にする
+    line_codes = {}
+    try:
+        old_chars = ''.join(chr(line_codes.setdefault(line, len(line_codes))) for line in old_lines)
+        new_chars = ''.join(chr(line_codes.setdefault(line, len(line_codes))) for line in new_lines)
+    except ValueError:
+        # 異なる行が多すぎて1文字ずつに置き換えられない場合は、全体を置き換えた差分とする
+        changes = ['-' + line for line in old_lines] + ['+' + line for line in new_lines]
+        return '\n'.join(changes), new_lines
+    line_array = list(line_codes)
+    diffs = _DMP.diff_main(old_chars, new_chars, False)
+
+    changes = []
+    for op, chars in diffs:
+        if op == diff_match_patch.DIFF_EQUAL:
+            continue
+        prefix = '+' if op == diff_match_patch.DIFF_INSERT else '-'
+        changes.extend(prefix + line_array[ord(char)] for char in chars)
+    return '\n'.join(changes), new_lines
+
+def open_log(log_filename, excel_filename):
+    """変更記録用のCSVファイルを追記モードで開く(新規作成時は既存のExcelファイルの記録を引き継ぐ)"""
+    is_new = not os.path.exists(log_filename)
+    log_fp = open(log_filename, 'a', newline='', encoding='utf-8')
+    if is_new:
+        writer = csv.writer(log_fp)
+        if os.path.exists(excel_filename):
+            wb = load_workbook(excel_filename, read_only=True)
+            writer.writerows(wb.active.iter_rows(values_only=True))
+            wb.close()
+        else:
+            writer.writerow(["Timestamp", "URL", "HTML Changes", "CSS Changes"])
+        log_fp.flush()
+    return log_fp
+
+def write_to_log(log_fp, timestamp, url, html_diff, css_diff):
+    """変更内容をCSVファイルに追記する"""
+    csv.writer(log_fp).writerow([timestamp, url, html_diff, css_diff])
+    log_fp.flush()
+
+def csv_to_xlsx(log_filename, excel_filename):
+    """CSVファイルの記録をExcelファイルに変換する(変換できた場合は True を返す)"""
+    try:
+        # 書き込み専用モードで1行ずつ書き出し、書き込み途中で壊れないよう一時ファイルから置き換える
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        with open(log_filename, newline='', encoding='utf-8') as f:
+            for row in csv.reader(f):
+                # ページのソースに含まれる制御文字はExcelのセルに書き込めないため取り除く
+                ws.append([ILLEGAL_CHARACTERS_RE.sub('', value) for value in row])
+        tmp_filename = excel_filename + '.tmp'
+        wb.save(tmp_filename)
+        os.replace(tmp_filename, excel_filename)
+        return True
+    except Exception as e:
+        logging.error(f"Excelファイルへの変換中にエラーが発生しました: {excel_filename} - エラー: {e}")
+        return False
+
+class SmtpClient:
+    """
+    SMTPサーバーへの接続を保持し、送信のたびに接続・TLS・ログインをやり直さないようにする
+
+    接続は最初の送信時に確立し、切断されていた場合は送信時に再接続する。
+    """
+
+    def __init__(self):
+        self.from_email = os.getenv('EMAIL_USER')
+        self._password = os.getenv('EMAIL_PASS')
+        self._smtp_server = os.getenv('SMTP_SERVER')
+        self._smtp_port = int(os.getenv('SMTP_PORT'))
+        self._use_tls = os.getenv('USE_TLS', 'True').lower() == 'true'
+        self._server = None
+
+    def _connect(self):
+        """SMTPサーバーに接続してログインする"""
+        if self._use_tls:
+            server = smtplib.SMTP(self._smtp_server, self._smtp_port, timeout=SMTP_TIMEOUT)
+        else:
+            server = smtplib.SMTP_SSL(self._smtp_server, self._smtp_port, timeout=SMTP_TIMEOUT)
+        try:
+            if self._use_tls:
+                server.starttls(context=ssl.create_default_context())
+            server.login(self.from_email, self._password)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+
+    def _is_connected(self):
+        """NOOP を送り、保持している接続がまだ使えるか確認する"""
+        if self._server is None:
+            return False
+        try:
+            return self._server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def send(self, msg):
+        """メッセージを送信する(接続が切れていれば再接続する)"""
+        if not self._is_connected():
+            self.close()
+            self._connect()
+        try:
+            self._server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # 確認の直後に切断された場合に備え、一度だけ再接続して送り直す
+            self.close()
+            self._connect()
+            self._server.send_message(msg)
+
+    def close(self):
+        """接続を閉じる"""
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except (smtplib.SMTPException, OSError):
+            self._server.close()
+        self._server = None
+
+def send_email(smtp, subject, body, to_email, attachment_path=None):
     """
     Excelファイルを添付してメールを送信する
 
@@ -67,119 +294,215 @@ def send_email(subject, body, to_email, attachment_path=None):
     2. アプリパスワードを生成する(Google アカウント > セキュリティ > アプリパスワード)
     3. 生成されたアプリパスワードを EMAIL_PASS 環境変数に設定する
     """
-    from_email = os.getenv('EMAIL_USER')
-    password = os.getenv('EMAIL_PASS')
-    smtp_server = os.getenv('SMTP_SERVER')
-    smtp_port = int(os.getenv('SMTP_PORT'))
-    use_tls = os.getenv('USE_TLS', 'True').lower() == 'true'
-
-    msg = MIMEMultipart()
-    msg['From'] = from_email
+    msg = EmailMessage()
+    msg['From'] = smtp.from_email
     msg['To'] = to_email
     msg['Subject'] = subject
-
-    msg.attach(MIMEText(body, 'plain'))
+    msg.set_content(body, cte='base64')
 
     if attachment_path and os.path.exists(attachment_path):
+        # ファイル全体を一度に読み込まず、少しずつ base64 に変換する
+        encoded = io.BytesIO()
         with open(attachment_path, 'rb') as attachment:
-            part = MIMEBase('application', 'octet-stream')
-            part.set_payload(attachment.read())
-
-        encoders.encode_base64(part)
-        part.add_header('Content-Disposition', f"attachment; filename= {os.path.basename(attachment_path)}")
+            base64.encode(attachment, encoded)
+
+        part = MIMEPart()
+        part['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        part['Content-Transfer-Encoding'] = 'base64'
+        part.add_header('Content-Disposition', 'attachment', filename=os.path.basename(attachment_path))
+        part.set_payload(encoded.getvalue().decode('ascii'))
+        msg.make_mixed()
         msg.attach(part)
 
     try:
-        if use_tls:
-            context = ssl.create_default_context()
-            with smtplib.SMTP(smtp_server, smtp_port) as server:
-                server.starttls(context=context)
-                server.login(from_email, password)
-                server.send_message(msg)
-        else:
-            with smtplib.SMTP_SSL(smtp_server, smtp_port) as server:
-                server.login(from_email, password)
-                server.send_message(msg)
+        smtp.send(msg)
         logging.info("メールが正常に送信されました")
     except Exception as e:
         logging.error(f"メール送信中にエラーが発生しました: {e}")
 
-def get_valid_url():
-    """有効なURLを取得する"""
+def get_valid_url(allow_empty=False):
+    """有効なURLを取得する(allow_empty が真の場合、空欄の入力で None を返す)"""
     while True:
         url = input("監視するウェブサイトのURLを入力してください(httpとhttpsは省略可能): ").strip()
+        if not url and allow_empty:
+            return None
         if not url.startswith(('http://', 'https://')):
             url = 'https://' + url
 
         # 簡単な正規表現でURLの形式を確認
-        if re.match(r'https?://[\w\-\.]+\.[a-zA-Z]{2,}', url):
+        if _URL_RE.match(url):
             return url
         print("無効なURLです。正しいURLを入力してください。")
 
+def get_valid_urls():
+    """監視する有効なURLの一覧を取得する(2件目以降は空欄で入力を終了する)"""
+    urls = [get_valid_url()]
+    while True:
+        print("他にも監視するURLがあれば入力してください(空欄で入力を終了します)。")
+        url = get_valid_url(allow_empty=True)
+        if url is None:
+            return urls
+        if url not in urls:
+            urls.append(url)
+
 def get_japan_time():
     """現在の日本時間を取得する"""
-    japan_tz = pytz.timezone('Asia/Tokyo')
-    return datetime.now(japan_tz).strftime("%Y-%m-%d %H:%M:%S")
-
-def main():
-    url = get_valid_url()
-
-    excel_filename = input("保存するExcelファイルの名前を入力してください(拡張子.xlsxは自動で追加されます): ")
-    excel_filename += ".xlsx"
-
-    to_email = os.getenv('TO_EMAIL')
-    if not to_email:
-        logging.error("エラー: TO_EMAILが設定されていません。.envファイルを確認してください。")
-        return
-
-    logging.info(f"{url} の監視を開始します。変更は {excel_filename} に記録され、設定されたメールアドレスに送信されます。")
+    return datetime.now(_JAPAN_TZ).strftime(_TIME_FORMAT)
 
-    previous_content = None
+def load_state(filename=STATE_FILENAME):
+    """保存された監視の状態を読み込む(ファイルがない、または読み込めない場合は空の辞書を返す)"""
+    try:
+        with open(filename, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.warning(f"状態ファイルを読み込めません: {filename} - エラー: {e}")
+        return {}
+
+def save_state(state, filename=STATE_FILENAME):
+    """監視の状態を保存する(書き込み途中で壊れないよう一時ファイルから置き換える)"""
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_filename, filename)
+
+def update_state(state, url, content_hash, html_lines, css_lines):
+    """比較の基準にしている内容と検証子を状態として保存する"""
+    state[url] = {
+        'etag': _last_etag.get(url),
+        'last_modified': _last_modified.get(url),
+        'hash': content_hash.hex(),
+        'html': html_lines,
+        'css': css_lines,
+    }
+    save_state(state)
+
+async def watch(url, state, log_fp, excel_filename, smtp, to_email):
+    """1つのURLを監視し、変更を記録してメールで通知する"""
+    previous_hash = None
     site_available = False
     first_successful_access = None
+    interval = MIN_POLL_INTERVAL
+
+    saved = state.get(url)
+    if saved:
+        # 前回の実行時の内容と比較して再開する(条件付きGETの検証子も引き継ぐ)
+        try:
+            previous_hash = bytes.fromhex(saved['hash'])
+            previous_html_lines, previous_css_lines = saved['html'], saved['css']
+            _last_etag[url] = saved['etag']
+            _last_modified[url] = saved['last_modified']
+        except (KeyError, TypeError, ValueError) as e:
+            logging.warning(f"サイト {url} の保存された状態が不正なため無視します - エラー: {e}")
+            previous_hash = None
 
     while True:
-        current_content = get_website_content(url)
-
-        if current_content is None:
+        try:
+            # requests はブロッキングのため、取得は別スレッドで行い他のURLの監視を止めない
+            result = await asyncio.to_thread(get_website_content, url)
+
+            if result is None:
+                if not site_available:
+                    logging.info(f"サイト {url} はまだ利用できません。監視を続けます...")
+                else:
+                    logging.warning(f"サイト {url} にアクセスできません。一時的なエラーの可能性があります。")
+                await asyncio.sleep(RETRY_INTERVAL)
+                continue
+
+            # 以降の解析・記録・メール送信はイベントループ上で順番に実行されるため、
+            # 複数のURLの監視から同じファイルへ同時に書き込まれることはない
             if not site_available:
-                logging.info(f"サイト {url} はまだ利用できません。監視を続けます...")
+                site_available = True
+                first_successful_access = get_japan_time()
+                logging.info(f"サイト {url} が利用可能になりました。最初のアクセス時刻: {first_successful_access}")
+                send_email(
+                    smtp,
+                    subject=f"ウェブサイト監視開始 - {url}",
+                    body=f"ウェブサイト {url} が利用可能になりました。監視を開始します。\n最初のアクセス時刻: {first_successful_access}",
+                    to_email=to_email
+                )
+
+            if result is UNCHANGED:
+                # 前回から変更がないため、解析と差分取得を省略する
+                interval = min(interval * 2, MAX_POLL_INTERVAL)
+                await asyncio.sleep(interval)
+                continue
+
+            current_content, current_charset, current_hash = result
+
+            if previous_hash is None:
+                # 比較の基準になる内容がまだないため、記録だけして次の確認を待つ
+                current_html, current_css = parse_html(current_content, current_charset)
+                previous_html_lines, previous_css_lines = current_html.splitlines(), current_css.splitlines()
+                previous_hash = current_hash
+                update_state(state, url, previous_hash, previous_html_lines, previous_css_lines)
+                await asyncio.sleep(interval)
+                continue
+
+            if current_hash == previous_hash:
+                # 内容が同一のため、解析と差分取得を省略する
+                interval = min(interval * 2, MAX_POLL_INTERVAL)
+                await asyncio.sleep(interval)
+                continue
+
+            current_html, current_css = parse_html(current_content, current_charset)
+
+            html_diff, current_html_lines = get_diff(previous_html_lines, current_html)
+            css_diff, current_css_lines = get_diff(previous_css_lines, current_css)
+
+            if html_diff or css_diff:
+                timestamp = get_japan_time()
+                write_to_log(log_fp, timestamp, url, html_diff, css_diff)
+                logging.info(f"{url} の変更を検出しました。{timestamp} に記録しました。")
+
+                # メール送信
+                subject = f"ウェブサイト変更通知 - {url}"
+                body = f"ウェブサイト {url} に変更が検出されました。詳細は添付のExcelファイルをご確認ください。"
+                # Excelファイルへの変換は添付する直前にだけ行う(変換できなかった場合は添付せずに通知する)
+                if csv_to_xlsx(log_fp.name, excel_filename):
+                    send_email(smtp, subject, body, to_email, excel_filename)
+                else:
+                    send_email(smtp, subject, body, to_email)
+
+                previous_html_lines, previous_css_lines = current_html_lines, current_css_lines
+                update_state(state, url, current_hash, previous_html_lines, previous_css_lines)
+                interval = MIN_POLL_INTERVAL
             else:
-                logging.warning(f"サイト {url} にアクセスできません。一時的なエラーの可能性があります。")
-            time.sleep(300)  # 5分後に再試行
-            continue
+                interval = min(interval * 2, MAX_POLL_INTERVAL)
 
-        if not site_available:
-            site_available = True
-            first_successful_access = get_japan_time()
-            logging.info(f"サイト {url} が利用可能になりました。最初のアクセス時刻: {first_successful_access}")
-            send_email(
-                subject=f"ウェブサイト監視開始 - {url}",
-                body=f"ウェブサイト {url} が利用可能になりました。監視を開始します。\n最初のアクセス時刻: {first_successful_access}",
-                to_email=to_email
-            )
-            previous_content = current_content
-            previous_html, previous_css = parse_html(current_content)
-            continue
+            previous_hash = current_hash
+            await asyncio.sleep(interval)
+        except Exception as e:
+            # 1つのサイトでの想定外のエラーで、他のサイトの監視まで止めないようにする
+            logging.error(f"サイト {url} の監視中にエラーが発生しました: {e}")
+            await asyncio.sleep(RETRY_INTERVAL)
 
-        current_html, current_css = parse_html(current_content)
+async def watch_all(urls, state, log_fp, excel_filename, smtp, to_email):
+    """すべてのURLを1つのイベントループで並行して監視する"""
+    await asyncio.gather(*(watch(url, state, log_fp, excel_filename, smtp, to_email) for url in urls))
 
-        html_diff = get_diff(previous_html, current_html)
-        css_diff = get_diff(previous_css, current_css)
+def main():
+    urls = get_valid_urls()
 
-        if html_diff or css_diff:
-            timestamp = get_japan_time()
-            write_to_excel(excel_filename, timestamp, url, html_diff, css_diff)
-            logging.info(f"変更を検出しました。{timestamp} に記録しました。")
+    excel_filename = input("保存するExcelファイルの名前を入力してください(拡張子.xlsxは自動で追加されます): ")
+    log_filename = excel_filename + ".csv"
+    excel_filename += ".xlsx"
 
-            # メール送信
-            subject = f"ウェブサイト変更通知 - {url}"
-            body = f"ウェブサイト {url} に変更が検出されました。詳細は添付のExcelファイルをご確認ください。"
-            send_email(subject, body, to_email, excel_filename)
+    to_email = os.getenv('TO_EMAIL')
+    if not to_email:
+        logging.error("エラー: TO_EMAILが設定されていません。.envファイルを確認してください。")
+        return
 
-            previous_html, previous_css = current_html, current_css
+    logging.info(f"{', '.join(urls)} の監視を開始します。変更は {log_filename} に記録され、{excel_filename} として設定されたメールアドレスに送信されます。")
 
-        time.sleep(1800)  # 30分(1800秒)待機
+    state = load_state()
+    smtp = SmtpClient()
+    try:
+        with open_log(log_filename, excel_filename) as log_fp:
+            asyncio.run(watch_all(urls, state, log_fp, excel_filename, smtp, to_email))
+    finally:
+        smtp.close()
 
 if __name__ == "__main__":
     main()